@@ -1,16 +1,29 @@
 import os
+import sys
 import json
+import orjson
 import re
 import logging
+import sqlite3
+import time
 import requests
-from pathlib import Path
+from requests.adapters import HTTPAdapter
 from typing import List, Dict, Any
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, Response, stream_with_context
+from flask_compress import Compress
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, update as sqla_update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime
 from youtube_search import YoutubeSearch
+from cachetools import TTLCache
 import yt_dlp
 import threading
+import atexit
+import queue
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 # Load environment variables from .env file
 from dotenv import load_dotenv
@@ -33,12 +46,49 @@ current_books_dir = BOOKS_DIR
 current_download_dir = DOWNLOAD_DIR
 os.makedirs(current_download_dir, exist_ok=True)
 
+# Bounded pool for downloads: a burst of clicks queues up instead of spawning
+# a thread (and an ffmpeg process) per request
+DOWNLOAD_POOL = ThreadPoolExecutor(
+    max_workers=int(os.getenv("DOWNLOAD_WORKERS", "4")),
+    thread_name_prefix="dl"
+)
+atexit.register(DOWNLOAD_POOL.shutdown, wait=False)
+
+# Separate pool for fanning out batch YouTube searches; searches are short
+# network calls, so they get more workers than the download pool
+SEARCH_POOL = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SEARCH_WORKERS", "16")),
+    thread_name_prefix="search"
+)
+atexit.register(SEARCH_POOL.shutdown, wait=False)
+
 # ---------------------------- App & DB ----------------------------
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///history.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Allow the download threads to share connections and wait out short write locks
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'check_same_thread': False, 'timeout': 30}}
+# Let browsers cache the static UI and gzip the JSON payloads
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 3600
+Compress(app)
 db = SQLAlchemy(app)
 
+
+@event.listens_for(Engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Tune each new SQLite connection: WAL lets the progress-hook writer and
+    /history readers run concurrently, and NORMAL sync makes the frequent
+    progress commits much cheaper than the default fsync-per-commit."""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA cache_size=-65536")  # 64 MB page cache
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")  # 256 MB
+    cursor.close()
+
 # Database model
 class History(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -48,11 +98,17 @@ class History(db.Model):
     youtube_url = db.Column(db.String(500))
     download_path = db.Column(db.String(1000))
     added_at = db.Column(db.String(50), default=lambda: datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"))
-    status = db.Column(db.String(20), default='pending')  # pending, downloading, completed, failed
+    status = db.Column(db.String(20), default='pending', index=True)  # pending, downloading, completed, failed
     progress = db.Column(db.Float, default=0.0)  # Download progress percentage (0.0 to 100.0)
     total_size = db.Column(db.BigInteger, default=0)  # Total size of the file being downloaded
     downloaded_size = db.Column(db.BigInteger, default=0)  # Size downloaded so far
 
+    __table_args__ = (
+        # At most one active (pending/downloading) download per video
+        db.Index('ux_active_url', 'youtube_url', unique=True,
+                 sqlite_where=db.text("status IN ('pending', 'downloading')")),
+    )
+
 # Create tables
 with app.app_context():
     db.create_all()
@@ -71,27 +127,44 @@ def init_db():
         return jsonify({"error": f"Error initializing database: {str(e)}"}), 500
 
 # ---------------------------- Book Scanning ----------------------------
+# Compiled once at import; these run for every book folder and every download
+_BY_RE = re.compile(r"^(.*?)\s+by\s+(.*)$", re.IGNORECASE)
+_UNSAFE_FN_RE = re.compile(r'[<>:"/\\|?*]')
+
+_DASH_CHARS = '-–—'
+
+
 def extract_author_title(folder_name: str) -> tuple[str, str]:
     """
     Extract author and title from folder name using common patterns
     E.g. "Author Name - Book Title" or "Book Title by Author Name"
     """
-    # Pattern: "Author Name - Book Title"
-    match = re.match(r"^(.*?)\s*[-–—]+\s*(.*)$", folder_name.strip())
-    if match:
-        author = match.group(1).strip()
-        title = match.group(2).strip()
-        return author, title
+    name = folder_name.strip()
+
+    # Pattern: "Author Name - Book Title" (split at the first dash run)
+    for i, ch in enumerate(name):
+        if ch in _DASH_CHARS:
+            end = i
+            while end < len(name) and name[end] in _DASH_CHARS:
+                end += 1
+            return name[:i].strip(), name[end:].strip()
 
     # Pattern: "Book Title by Author Name"
-    match = re.match(r"^(.*?)\s+by\s+(.*)$", folder_name.strip(), re.IGNORECASE)
+    by_pos = name.lower().find(' by ')
+    if by_pos != -1:
+        title = name[:by_pos].strip()
+        author = name[by_pos + 4:].strip()
+        return author, title
+
+    # Compiled pattern as a fallback for unusual whitespace around "by"
+    match = _BY_RE.match(name)
     if match:
         title = match.group(1).strip()
         author = match.group(2).strip()
         return author, title
 
     # If no pattern matches, return folder name as title with empty author
-    return "", folder_name.strip()
+    return "", name
 
 def extract_video_id(youtube_url: str) -> str:
     """Extract video ID from YouTube URL"""
@@ -113,7 +186,7 @@ def extract_video_id(youtube_url: str) -> str:
 def download_thumbnail(thumbnail_url: str, output_path: str):
     """Download thumbnail from URL to specified path"""
     try:
-        response = requests.get(thumbnail_url, stream=True)
+        response = _SESSION.get(thumbnail_url, stream=True)
         if response.status_code == 200:
             with open(output_path, 'wb') as f:
                 for chunk in response.iter_content(1024):
@@ -124,74 +197,117 @@ def download_thumbnail(thumbnail_url: str, output_path: str):
     except Exception as e:
         logger.error(f"Error downloading thumbnail: {str(e)}")
 
+# Supported book file extensions
+_BOOK_EXTENSIONS = frozenset({
+    '.pdf', '.epub', '.mobi', '.azw', '.azw3', '.djvu', '.fb2', '.html',
+    '.lit', '.lrf', '.odt', '.prc', '.rb', '.rtf', '.txt'
+})
+
+# Cache the parsed book list keyed on (dir, mtime) so repeat /books hits skip
+# the full directory walk until something actually changes
+_BOOKS_CACHE = {'key': None, 'val': None}
+_BOOKS_CACHE_LOCK = threading.Lock()
+
+
+def _invalidate_books_cache():
+    """Drop the cached book list (e.g. after the books directory changes)"""
+    with _BOOKS_CACHE_LOCK:
+        _BOOKS_CACHE['key'] = None
+        _BOOKS_CACHE['val'] = None
+
+
 def scan_book_files() -> List[Dict[str, str]]:
     """Scan the current_books_dir for book files and folders and extract author/title info, including Author/Book structure"""
     book_items = []
-    
-    books_path = Path(current_books_dir)
-    if not books_path.exists():
+
+    # Single stat serves both the existence check and the cache key
+    try:
+        root_stat = os.stat(current_books_dir)
+    except OSError:
         logger.warning(f"Books directory does not exist: {current_books_dir}")
         return book_items
 
-    # Define supported book file extensions
-    book_extensions = {'.pdf', '.epub', '.mobi', '.azw', '.azw3', '.djvu', '.fb2', '.html', '.lit', '.lrf', '.odt', '.prc', '.rb', '.rtf', '.txt'}
-    
-    for item in books_path.iterdir():
-        if item.is_dir():
-            # Check if this is an author directory that contains book subdirectories
-            author_name = item.name
-            author_path = item
-            
-            # Look for book directories within the author directory
-            for book_item in author_path.iterdir():
-                if book_item.is_dir():
-                    # This is a book directory inside an author directory
-                    book_name = book_item.name
+    cache_key = (current_books_dir, root_stat.st_mtime_ns)
+    with _BOOKS_CACHE_LOCK:
+        if _BOOKS_CACHE['key'] == cache_key:
+            return _BOOKS_CACHE['val']
+
+    abs_root = os.path.abspath(current_books_dir)
+
+    # os.scandir yields DirEntry objects whose type info is cached from the
+    # directory read itself, so is_dir/is_file don't cost an extra stat each
+    with os.scandir(abs_root) as root_entries:
+        for entry in root_entries:
+            if entry.is_dir(follow_symlinks=False):
+                # Check if this is an author directory that contains book subdirectories
+                # Intern the author: the same string repeats for every book
+                # in the folder, so the cached list shares one object
+                author_name = sys.intern(entry.name)
+                author_root = os.path.join(abs_root, entry.name)
+                has_subdirs = False
+
+                # Look for book directories within the author directory
+                with os.scandir(author_root) as author_entries:
+                    for book_entry in author_entries:
+                        if book_entry.is_dir(follow_symlinks=False):
+                            # This is a book directory inside an author directory
+                            has_subdirs = True
+                            book_name = book_entry.name
+                            book_items.append({
+                                "item_name": book_entry.name,
+                                "full_path": os.path.join(author_root, book_entry.name),
+                                "author": author_name,
+                                "title": book_name,
+                                "search_query": f"{book_name} {author_name}".strip(),
+                                "type": "folder"
+                            })
+                        elif book_entry.is_file(follow_symlinks=False):
+                            stem, ext = os.path.splitext(book_entry.name)
+                            if ext.lower() not in _BOOK_EXTENSIONS:
+                                continue
+                            # This is a book file directly in the author directory
+                            _, book_title = extract_author_title(stem)
+                            book_items.append({
+                                "item_name": book_entry.name,
+                                "full_path": os.path.join(author_root, book_entry.name),
+                                "author": author_name,
+                                "title": book_title,
+                                "search_query": f"{book_title} {author_name}".strip(),
+                                "type": "file"
+                            })
+
+                # Also handle the case where the first-level directory is just a regular book folder (backward compatibility)
+                # This would be for any directories that don't follow the Author/Book structure
+                if not has_subdirs:  # If no subdirectories, treat as before
+                    author, title = extract_author_title(entry.name)
+                    author = sys.intern(author)
                     book_items.append({
-                        "item_name": book_item.name,
-                        "full_path": str(book_item.absolute()),
-                        "author": author_name,
-                        "title": book_name,
-                        "search_query": f"{book_name} {author_name}".strip(),
+                        "item_name": entry.name,
+                        "full_path": author_root,
+                        "author": author,
+                        "title": title,
+                        "search_query": f"{title} {author}".strip(),
                         "type": "folder"
                     })
-                elif book_item.is_file() and book_item.suffix.lower() in book_extensions:
-                    # This is a book file directly in the author directory
-                    _, book_title = extract_author_title(book_item.stem)
-                    book_items.append({
-                        "item_name": book_item.name,
-                        "full_path": str(book_item.absolute()),
-                        "author": author_name,
-                        "title": book_title,
-                        "search_query": f"{book_title} {author_name}".strip(),
-                        "type": "file"
-                    })
-            
-            # Also handle the case where the first-level directory is just a regular book folder (backward compatibility)
-            # This would be for any directories that don't follow the Author/Book structure
-            # Check if the directory doesn't contain subdirectories that could be books
-            subdirs = [sub for sub in item.iterdir() if sub.is_dir()]
-            if not subdirs:  # If no subdirectories, treat as before
-                author, title = extract_author_title(item.name)
+            elif entry.is_file(follow_symlinks=False):
+                stem, ext = os.path.splitext(entry.name)
+                if ext.lower() not in _BOOK_EXTENSIONS:
+                    continue
+                # Handle book files at the root level
+                author, title = extract_author_title(stem)
+                author = sys.intern(author)
                 book_items.append({
-                    "item_name": item.name,
-                    "full_path": str(item.absolute()),
+                    "item_name": entry.name,
+                    "full_path": os.path.join(abs_root, entry.name),
                     "author": author,
                     "title": title,
                     "search_query": f"{title} {author}".strip(),
-                    "type": "folder"
+                    "type": "file"
                 })
-        elif item.is_file() and item.suffix.lower() in book_extensions:
-            # Handle book files at the root level
-            author, title = extract_author_title(item.stem)  # Use stem (filename without extension)
-            book_items.append({
-                "item_name": item.name,
-                "full_path": str(item.absolute()),
-                "author": author,
-                "title": title,
-                "search_query": f"{title} {author}".strip(),
-                "type": "file"
-            })
+
+    with _BOOKS_CACHE_LOCK:
+        _BOOKS_CACHE['key'] = cache_key
+        _BOOKS_CACHE['val'] = book_items
 
     return book_items
 
@@ -204,7 +320,9 @@ def scan_book_folders() -> List[Dict[str, str]]:
 # ---------------------------- Routes ----------------------------
 @app.route('/')
 def home():
-    return render_template('index.html')
+    # The UI is a plain static page; send_static_file serves it with
+    # ETag/Last-Modified so repeat visits get a 304 instead of a render
+    return app.send_static_file('index.html')
 
 @app.route('/health')
 def health():
@@ -221,18 +339,96 @@ def get_books():
         return jsonify({"error": f"Error scanning book files and folders: {str(e)}"}), 500
 
 # ---------------------------- YouTube Search ----------------------------
+# Shared HTTP session so repeat searches/thumbnail fetches reuse keep-alive
+# connections instead of paying a TLS handshake per call
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(pool_connections=32, pool_maxsize=64))
+_SESSION.headers.update({
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36',
+    'Accept-Language': 'en-US,en;q=0.9',
+})
+
+_YT_INITIAL_DATA_RE = re.compile(r'ytInitialData\s*=\s*({.*?});')
+
+
+def _parse_search_results(data: Dict[str, Any], max_results: int) -> List[Dict[str, Any]]:
+    """Walk the ytInitialData JSON from a results page and format video entries"""
+    formatted_results = []
+    sections = (data.get('contents', {})
+                    .get('twoColumnSearchResultsRenderer', {})
+                    .get('primaryContents', {})
+                    .get('sectionListRenderer', {})
+                    .get('contents', []))
+    for section in sections:
+        for item in section.get('itemSectionRenderer', {}).get('contents', []):
+            video = item.get('videoRenderer')
+            if not video or 'videoId' not in video:
+                continue
+            video_id = video['videoId']
+            title_runs = video.get('title', {}).get('runs', [])
+            channel_runs = video.get('ownerText', {}).get('runs', [])
+            formatted_results.append({
+                "id": video_id,
+                "title": title_runs[0]['text'] if title_runs else "N/A",
+                "channel": channel_runs[0]['text'] if channel_runs else "N/A",
+                "duration": video.get('lengthText', {}).get('simpleText', "N/A"),
+                "publish_time": video.get('publishedTimeText', {}).get('simpleText', "N/A"),
+                "view_count": video.get('viewCountText', {}).get('simpleText', "N/A"),
+                "url": f"https://www.youtube.com/watch?v={video_id}",
+                "thumbnail": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg"
+            })
+            if len(formatted_results) >= max_results:
+                return formatted_results
+    return formatted_results
+
+
+# Repeat searches within the TTL are answered from memory instead of
+# re-hitting YouTube
+_SEARCH_CACHE = TTLCache(maxsize=1024, ttl=600)
+_SEARCH_CACHE_LOCK = threading.Lock()
+
+
 def search_youtube_sync(query: str, max_results: int = 10) -> List[Dict[str, Any]]:
+    """Search YouTube for audiobook content matching the query (cached)"""
+    key = (query, max_results)
+    with _SEARCH_CACHE_LOCK:
+        cached = _SEARCH_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    results = _search_youtube_uncached(query, max_results)
+    if results:  # don't cache failed or empty lookups
+        with _SEARCH_CACHE_LOCK:
+            _SEARCH_CACHE[key] = results
+    return results
+
+
+def _search_youtube_uncached(query: str, max_results: int = 10) -> List[Dict[str, Any]]:
     """Search YouTube for audiobook content matching the query"""
     # Check if "full audiobook" is already in the query to avoid duplication
     if "full audiobook" not in query.lower():
         enhanced_query = f"{query} full audiobook"
     else:
         enhanced_query = query
-    
+
     try:
-        # Use youtube-search-python library to search
+        # Fetch the results page over the pooled session and parse the embedded
+        # ytInitialData JSON directly (same fields YoutubeSearch scrapes, but
+        # with connection reuse and no HTML parsing)
+        response = _SESSION.get(
+            "https://www.youtube.com/results",
+            params={"search_query": enhanced_query},
+            timeout=15
+        )
+        response.raise_for_status()
+        match = _YT_INITIAL_DATA_RE.search(response.text)
+        if match:
+            return _parse_search_results(json.loads(match.group(1)), max_results)
+
+        # Fall back to the youtube-search library if the page layout changed
+        logger.warning(f"ytInitialData not found for '{enhanced_query}', falling back to YoutubeSearch")
         results = YoutubeSearch(enhanced_query, max_results=max_results).to_dict()
-        
+
         formatted_results = []
         for result in results:
             formatted_results.append({
@@ -245,7 +441,7 @@ def search_youtube_sync(query: str, max_results: int = 10) -> List[Dict[str, Any
                 "url": f"https://www.youtube.com/watch?v={result['id']}",
                 "thumbnail": f"https://i.ytimg.com/vi/{result['id']}/hqdefault.jpg"
             })
-        
+
         return formatted_results
     except Exception as e:
         logger.error(f"Error searching YouTube for '{enhanced_query}': {str(e)}")
@@ -272,7 +468,80 @@ def search_audiobooks():
         logger.error(error_msg, exc_info=True)
         return jsonify({"error": error_msg}), 502
 
+@app.route('/search/batch', methods=['POST'])
+def search_audiobooks_batch():
+    """Search YouTube for several queries concurrently"""
+    payload = request.get_json()
+    queries = payload.get("queries", [])
+    max_results = payload.get("maxResults", 10)
+
+    if not isinstance(queries, list) or not queries:
+        return jsonify({"error": "Missing required field: queries"}), 400
+
+    logger.info(f"Batch searching YouTube for {len(queries)} queries")
+
+    try:
+        # Fan the queries out over the search pool instead of running serially
+        results = list(SEARCH_POOL.map(lambda q: search_youtube_sync(q, max_results), queries))
+        return jsonify({"results": results, "queries": queries})
+    except Exception as e:
+        error_msg = f"YouTube batch search failed: {str(e)}"
+        logger.error(error_msg, exc_info=True)
+        return jsonify({"error": error_msg}), 502
+
 # ---------------------------- Download Management ----------------------------
+# Static yt-dlp options shared by every download; per-download pieces
+# (outtmpl, progress hook) are swapped on a reused instance instead
+_YDL_BASE_OPTS = {
+    'format': 'bestaudio/best',
+    'postprocessors': [{
+        'key': 'FFmpegExtractAudio',
+        'preferredcodec': 'mp3',
+        'preferredquality': '192',
+    }],
+    'postprocessor_args': {
+        # Dict form targets the ffmpeg executable specifically
+        'ffmpeg': [
+            '-threads', '0', # Use all cores for the MP3 encode
+            '-ar', '44100',  # Set audio sample rate
+            '-ac', '2',      # Set audio channels
+            '-b:a', '192k',  # Set audio bitrate
+            '-vn',           # Remove video stream
+        ],
+    },
+    'prefer_ffmpeg': True,
+    'audioquality': '0',
+    'extractaudio': True,
+    'audioformat': 'mp3',
+    'noplaylist': True,
+    'quiet': True,
+    'no_warnings': False,
+}
+
+# One YoutubeDL per download worker thread: constructing an instance rebuilds
+# the extractor/postprocessor chain every time, and instances are not
+# thread-safe, so each pool thread keeps its own
+_YDL_LOCAL = threading.local()
+
+
+def _dispatch_progress_hook(d):
+    """Stable hook registered once per instance; forwards to the hook of the
+    download currently running on this thread"""
+    hook = getattr(_YDL_LOCAL, 'progress_hook', None)
+    if hook is not None:
+        hook(d)
+
+
+def _get_ydl() -> yt_dlp.YoutubeDL:
+    ydl = getattr(_YDL_LOCAL, 'ydl', None)
+    if ydl is None:
+        opts = dict(_YDL_BASE_OPTS)
+        opts['progress_hooks'] = [_dispatch_progress_hook]
+        ydl = yt_dlp.YoutubeDL(opts)
+        _YDL_LOCAL.ydl = ydl
+    return ydl
+
+
 def download_youtube_audio(youtube_url: str, output_path: str, title: str, progress_callback=None) -> bool:
     """Download and convert YouTube video to MP3 with progress tracking"""
     try:
@@ -291,56 +560,100 @@ def download_youtube_audio(youtube_url: str, output_path: str, title: str, progr
                         # Just indicate that download is happening
                         progress_callback(0.0, 0, d['downloaded_bytes'])
 
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }],
-            'postprocessor_args': [
-                '-ar', '44100',  # Set audio sample rate
-                '-ac', '2',      # Set audio channels
-                '-b:a', '192k',  # Set audio bitrate
-                '-vn',           # Remove video stream
-            ],
-            'prefer_ffmpeg': True,
-            'audioquality': '0',
-            'extractaudio': True,
-            'audioformat': 'mp3',
-            'outtmpl': output_path.replace('.%(ext)s', '.mp3'),  # Ensure .mp3 extension
-            'noplaylist': True,
-            'quiet': True,
-            'no_warnings': False,
-            'progress_hooks': [progress_hook],
-        }
-
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        ydl = _get_ydl()
+        # Keep the source extension in the template and let FFmpegExtractAudio
+        # produce the .mp3; the old literal .mp3 path made yt-dlp write the
+        # pre-conversion audio under a wrong extension first
+        ydl.params['outtmpl'] = {'default': output_path.rsplit('.mp3', 1)[0] + '.%(ext)s'}
+        _YDL_LOCAL.progress_hook = progress_hook
+        try:
             ydl.download([youtube_url])
-        
+        finally:
+            _YDL_LOCAL.progress_hook = None
+
         logger.info(f"Successfully downloaded and converted: {title}")
         return True
     except Exception as e:
         logger.error(f"Error downloading {youtube_url}: {str(e)}")
         return False
 
-def update_download_progress(download_id: int, progress: float, total_size: int, downloaded_size: int):
-    """Update download progress in the database"""
-    try:
+# All writes from download workers funnel through one writer thread so they
+# never contend for SQLite's single write lock; each queued op is a callable
+# taking the session, and the writer drains the queue in batches per commit
+_WRITE_Q = queue.Queue()
+
+
+def _db_writer():
+    while True:
+        ops = [_WRITE_Q.get()]
+        # Drain whatever else is already queued so one commit covers the batch
+        while len(ops) < 100:
+            try:
+                ops.append(_WRITE_Q.get_nowait())
+            except queue.Empty:
+                break
         with app.app_context():
-            history_item = History.query.get(download_id)
-            if history_item:
-                history_item.progress = progress
-                history_item.total_size = total_size
-                history_item.downloaded_size = downloaded_size
+            try:
+                for op in ops:
+                    op(db.session)
                 db.session.commit()
-    except Exception as e:
-        logger.error(f"Error updating progress for download {download_id}: {str(e)}")
+            except Exception as e:
+                logger.error(f"Error applying batched DB writes: {str(e)}")
+                db.session.rollback()
+
+
+_WRITER_THREAD = threading.Thread(target=_db_writer, name="db-writer", daemon=True)
+_WRITER_THREAD.start()
+
+
+# Per-download SSE subscribers; writers push updates so streaming clients
+# don't have to poll /progress (and hit SQLite) on a timer
+_PROGRESS_SUBS: Dict[int, List[queue.Queue]] = defaultdict(list)
+_PROGRESS_SUBS_LOCK = threading.Lock()
+
+
+def _publish_progress(download_id: int, status: str, progress: float, total_size: int, downloaded_size: int):
+    """Push a progress update to any SSE subscribers for this download"""
+    with _PROGRESS_SUBS_LOCK:
+        subscribers = list(_PROGRESS_SUBS.get(download_id, ()))
+    for q in subscribers:
+        try:
+            q.put_nowait({
+                "id": download_id,
+                "status": status,
+                "progress": progress,
+                "total_size": total_size,
+                "downloaded_size": downloaded_size
+            })
+        except queue.Full:
+            pass  # Slow consumer; it will catch up on its next event
+
+
+def update_download_progress(download_id: int, progress: float, total_size: int, downloaded_size: int):
+    """Queue a download progress update for the writer thread"""
+    # Core UPDATE: no row load and no identity-map churn on the hot path
+    _WRITE_Q.put(lambda session: session.execute(
+        sqla_update(History)
+        .where(History.id == download_id)
+        .values(progress=progress, total_size=total_size, downloaded_size=downloaded_size)
+    ))
+    _publish_progress(download_id, 'downloading', progress, total_size, downloaded_size)
 
 
 def download_youtube_audio_async(download_id: int, youtube_url: str, output_path: str, book_title: str, author: str, youtube_title: str, audiobook_folder: str = None):
     """Asynchronous wrapper for downloading YouTube audio with progress tracking"""
+    # yt-dlp fires its progress hook on every chunk; coalesce the DB writes so
+    # we only commit when progress moved >=1% or >=500ms passed (always on 100%)
+    last_write = {'pct': -1.0, 'ts': 0.0}
+
     def progress_callback(progress, total_size, downloaded_size):
+        now = time.monotonic()
+        if (progress - last_write['pct'] < 1.0
+                and now - last_write['ts'] < 0.5
+                and progress < 100.0):
+            return
+        last_write['pct'] = progress
+        last_write['ts'] = now
         # Update progress in database
         update_download_progress(download_id, progress, total_size, downloaded_size)
     
@@ -348,15 +661,13 @@ def download_youtube_audio_async(download_id: int, youtube_url: str, output_path
         # Create a new application context for this thread
         with app.app_context():
             # Update database status to downloading
-            history_item = History.query.get(download_id)
-            if history_item:
-                history_item.download_path = output_path
-                history_item.status = 'downloading'
-                history_item.progress = 0.0
-                history_item.total_size = 0
-                history_item.downloaded_size = 0
-                db.session.commit()
-            
+            _WRITE_Q.put(lambda session: session.execute(
+                sqla_update(History)
+                .where(History.id == download_id)
+                .values(download_path=output_path, status='downloading',
+                        progress=0.0, total_size=0, downloaded_size=0)
+            ))
+
             # Use the actual author name or "Unknown" in the title for the download function
             display_title = f"{book_title} by {author if author and author.strip() else 'Unknown'}"
             success = download_youtube_audio(youtube_url, output_path, display_title, progress_callback)
@@ -376,21 +687,29 @@ def download_youtube_audio_async(download_id: int, youtube_url: str, output_path
                     # Continue even if thumbnail download fails
             
             # Update database status based on success
-            history_item = History.query.get(download_id)
-            if history_item:
-                history_item.status = 'completed' if success else 'failed'
-                if success:
-                    # Set progress to 100% on completion
-                    history_item.progress = 100.0
-                db.session.commit()
+            final_status = 'completed' if success else 'failed'
+            final_values = {'status': final_status}
+            if success:
+                # Set progress to 100% on completion
+                final_values['progress'] = 100.0
+            _WRITE_Q.put(lambda session: session.execute(
+                sqla_update(History).where(History.id == download_id).values(**final_values)
+            ))
+
+            row = db.session.query(
+                History.progress, History.total_size, History.downloaded_size
+            ).filter(History.id == download_id).first()
+            if row:
+                _publish_progress(download_id, final_status, row.progress or 0.0,
+                                  row.total_size or 0, row.downloaded_size or 0)
     except Exception as e:
         logger.error(f"Error in async download for {youtube_url}: {str(e)}")
-        with app.app_context():
-            history_item = History.query.get(download_id)
-            if history_item:
-                history_item.status = 'failed'
-                history_item.progress = 0.0
-                db.session.commit()
+        _WRITE_Q.put(lambda session: session.execute(
+            sqla_update(History)
+            .where(History.id == download_id)
+            .values(status='failed', progress=0.0)
+        ))
+        _publish_progress(download_id, 'failed', 0.0, 0, 0)
 
 @app.route('/download', methods=['POST'])
 def download_audiobook():
@@ -424,12 +743,22 @@ def download_audiobook():
             return jsonify({"error": "Missing required field: youtube_title"}), 400
         # Author can be empty string, so we don't check for it as required
         
+        # Two rapid clicks on the same video would start two workers writing
+        # the same file; return the in-flight download instead
+        existing = History.query.filter(
+            History.youtube_url == youtube_url,
+            History.status.in_(('pending', 'downloading'))
+        ).first()
+        if existing:
+            logger.info(f"Download already in progress for {youtube_url} (ID: {existing.id})")
+            return jsonify({"ok": True, "download_id": existing.id, "duplicate": True})
+
         # Use 'Unknown' for empty author to avoid issues in filename
         display_author = author if author and author.strip() else "Unknown"
         logger.info(f"Starting download: {book_title} by {display_author} from {youtube_url}")
         
         # Create a unique folder name for the audiobook
-        safe_folder_name = re.sub(r'[<>:"/\\|?*]', '_', f"{book_title} by {display_author}")
+        safe_folder_name = _UNSAFE_FN_RE.sub('_', f"{book_title} by {display_author}")
         audiobook_folder = os.path.join(current_download_dir, safe_folder_name)
         
         # Create the audiobook folder if it doesn't exist
@@ -451,18 +780,30 @@ def download_audiobook():
             downloaded_size=0
         )
         db.session.add(history_item)
-        db.session.commit()
-        
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Lost the race with a concurrent request for the same URL; the
+            # unique partial index rejected the second insert
+            db.session.rollback()
+            existing = History.query.filter(
+                History.youtube_url == youtube_url,
+                History.status.in_(('pending', 'downloading'))
+            ).first()
+            if existing:
+                logger.info(f"Download already in progress for {youtube_url} (ID: {existing.id})")
+                return jsonify({"ok": True, "download_id": existing.id, "duplicate": True})
+            raise
+
         logger.info(f"Added download to history with ID: {history_item.id}")
         
-        # Start download in a separate thread
-        thread = threading.Thread(
-            target=download_youtube_audio_async,
-            args=(history_item.id, youtube_url, output_path, book_title, author, youtube_title, audiobook_folder)
+        # Hand the download to the bounded worker pool
+        DOWNLOAD_POOL.submit(
+            download_youtube_audio_async,
+            history_item.id, youtube_url, output_path, book_title, author, youtube_title, audiobook_folder
         )
-        thread.start()
-        
-        logger.info(f"Started download thread for ID: {history_item.id}")
+
+        logger.info(f"Queued download task for ID: {history_item.id}")
         
         return jsonify({"ok": True, "download_id": history_item.id})
     except Exception as e:
@@ -504,7 +845,8 @@ def set_config():
         # If both directories are valid, update the global variables
         current_books_dir = new_books_dir
         current_download_dir = new_download_dir
-        
+        _invalidate_books_cache()
+
         return jsonify({
             "ok": True,
             "books_dir": current_books_dir,
@@ -519,8 +861,14 @@ def set_config():
 def get_history():
     """Get download history"""
     try:
-        history_items = History.query.order_by(History.id.desc()).limit(200).all()
-        
+        # Select only the columns the UI renders; skips loading the wide
+        # download_path TEXT column for every row
+        history_items = db.session.query(
+            History.id, History.book_title, History.author, History.youtube_title,
+            History.youtube_url, History.added_at, History.status,
+            History.progress, History.total_size, History.downloaded_size
+        ).order_by(History.id.desc()).limit(200).all()
+
         items = []
         for item in history_items:
             items.append({
@@ -529,15 +877,15 @@ def get_history():
                 "author": item.author,
                 "youtube_title": item.youtube_title,
                 "youtube_url": item.youtube_url,
-                "download_path": item.download_path,
                 "added_at": item.added_at,
                 "status": item.status,
                 "progress": float(item.progress) if item.progress is not None else 0.0,
                 "total_size": int(item.total_size) if item.total_size is not None else 0,
                 "downloaded_size": int(item.downloaded_size) if item.downloaded_size is not None else 0
             })
-        
-        return jsonify({"items": items})
+
+        # orjson is considerably faster than stdlib json for this payload
+        return Response(orjson.dumps({"items": items}), mimetype='application/json')
     except Exception as e:
         logger.error(f"Error getting history: {str(e)}")
         # Return empty items array to maintain expected structure
@@ -575,5 +923,57 @@ def get_download_progress(download_id):
         logger.error(f"Error getting download progress: {str(e)}")
         return jsonify({"error": f"Error getting download progress: {str(e)}"}), 500
 
+@app.route('/progress/<int:download_id>/stream')
+def stream_download_progress(download_id):
+    """Stream progress updates for a download as Server-Sent Events"""
+    history_item = History.query.get(download_id)
+    if not history_item:
+        return jsonify({"error": "Download not found"}), 404
+
+    initial = {
+        "id": history_item.id,
+        "status": history_item.status,
+        "progress": float(history_item.progress) if history_item.progress is not None else 0.0,
+        "total_size": int(history_item.total_size) if history_item.total_size is not None else 0,
+        "downloaded_size": int(history_item.downloaded_size) if history_item.downloaded_size is not None else 0
+    }
+
+    q = queue.Queue(maxsize=100)
+    with _PROGRESS_SUBS_LOCK:
+        _PROGRESS_SUBS[download_id].append(q)
+
+    def generate():
+        try:
+            # Send the current state immediately, then push-only updates
+            yield f"data: {json.dumps(initial)}\n\n"
+            if initial["status"] in ('completed', 'failed'):
+                return
+            while True:
+                try:
+                    update_event = q.get(timeout=30)
+                except queue.Empty:
+                    # Keepalive comment so proxies don't drop the idle stream
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {json.dumps(update_event)}\n\n"
+                if update_event["status"] in ('completed', 'failed'):
+                    return
+        finally:
+            with _PROGRESS_SUBS_LOCK:
+                subscribers = _PROGRESS_SUBS.get(download_id)
+                if subscribers and q in subscribers:
+                    subscribers.remove(q)
+                if subscribers is not None and not subscribers:
+                    del _PROGRESS_SUBS[download_id]
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8080, debug=True)
\ No newline at end of file
+    if os.getenv("FLASK_DEBUG") == "1":
+        app.run(host='0.0.0.0', port=8080, debug=True)
+    else:
+        # Multi-threaded WSGI server so concurrent /search, /progress and
+        # /history requests don't queue behind each other's network/DB I/O
+        from waitress import serve
+        serve(app, host='0.0.0.0', port=8080, threads=int(os.getenv("WEB_THREADS", "16")))
\ No newline at end of file